@@ -0,0 +1,95 @@
+"""下载队列：run_exclusive() 运行时没有任何 yt-dlp 进程（使用引擎替身）"""
+import threading
+import time
+import unittest
+
+from ytdlpcore import DownloadJob, DownloadManager
+
+
+class FakeEngine:
+    """记录 yt-dlp 调用的开始和结束；probe/iter_playlist 在对应的事件被设置前不返回"""
+
+    def __init__(self):
+        self.events = []
+        self.release_probe = threading.Event()
+        self.release_listing = threading.Event()
+        self.lock = threading.Lock()
+
+    def record(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def log(self, message):
+        pass
+
+    def reusable_info_json(self, job):
+        return False
+
+    def probe(self, job):
+        self.record(f'probe {job.url}')
+        self.release_probe.wait(5)
+        self.record(f'probed {job.url}')
+        return {'title': job.url}
+
+    def run(self, job, on_state=None, on_progress=None):
+        self.record(f'download {job.url}')
+        job.returncode = 0
+        job.status = 'done'
+        job.finished_at = time.time()
+        return job
+
+    def iter_playlist(self, url, probe_args=()):
+        self.record('listing')
+        yield {'url': 'https://www.youtube.com/watch?v=aaaaaaaaaaa'}
+        self.release_listing.wait(5)
+        yield {'url': 'https://www.youtube.com/watch?v=bbbbbbbbbbb'}
+        self.record('listed')
+
+
+class RunExclusiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = FakeEngine()
+        self.manager = DownloadManager(self.engine, max_workers=2)
+        self.done = threading.Event()
+
+    def exclusive(self):
+        self.engine.record('update')
+        self.done.set()
+
+    def wait_for(self, event):
+        deadline = time.time() + 5
+        while event not in self.engine.events and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIn(event, self.engine.events)
+
+    def test_waits_for_running_probe_and_holds_new_ones(self):
+        self.manager.submit(DownloadJob('https://www.youtube.com/watch?v=first', []))
+        self.wait_for('probe https://www.youtube.com/watch?v=first')
+        self.manager.run_exclusive(self.exclusive)
+        time.sleep(0.2)
+        self.manager.submit(DownloadJob('https://www.youtube.com/watch?v=second', []))
+        time.sleep(0.2)
+        self.assertNotIn('update', self.engine.events)
+        self.engine.release_probe.set()
+        self.assertTrue(self.done.wait(5))
+        self.wait_for('probed https://www.youtube.com/watch?v=second')
+        events = self.engine.events
+        self.assertLess(events.index('probed https://www.youtube.com/watch?v=first'), events.index('update'))
+        self.assertLess(events.index('update'), events.index('probe https://www.youtube.com/watch?v=second'))
+
+    def test_waits_for_playlist_listing(self):
+        self.engine.release_probe.set()
+        self.manager.expand('https://www.youtube.com/playlist?list=PL1', lambda url: DownloadJob(url, []))
+        self.wait_for('listing')
+        self.manager.run_exclusive(self.exclusive)
+        # 展开期间下载照常进行
+        self.wait_for('download https://www.youtube.com/watch?v=aaaaaaaaaaa')
+        self.assertNotIn('update', self.engine.events)
+        self.engine.release_listing.set()
+        self.assertTrue(self.done.wait(5))
+        self.assertLess(self.engine.events.index('listed'), self.engine.events.index('update'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+"""历史记录：导入旧版 JSON 后按视频键查找"""
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from ytdlpcore import HistoryStore, video_key_from_url
+
+
+class HistoryVideoKeyTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.db = os.path.join(directory, 'history.db')
+        self.legacy = os.path.join(directory, 'download_history.json')
+        with open(self.legacy, 'w', encoding='utf-8') as f:
+            json.dump([{'url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ', 'title': 'Rick',
+                        'timestamp': '2024-01-01T00:00:00'}], f)
+
+    def open(self):
+        store = HistoryStore(self.db, legacy_json=self.legacy)
+        self.addCleanup(store.close)
+        return store
+
+    def test_imported_entries_are_found_by_video_key(self):
+        store = self.open()
+        item = store.find_by_video_key(video_key_from_url('https://youtu.be/dQw4w9WgXcQ'))
+        self.assertEqual(item['title'], 'Rick')
+
+    def test_missing_video_keys_are_filled_once(self):
+        self.open().close()
+        # 旧版本建立的数据库：导入的记录没有视频键
+        with sqlite3.connect(self.db) as conn:
+            conn.execute("UPDATE history SET video_key = NULL")
+            conn.execute("DELETE FROM meta WHERE key = 'video_keys_filled'")
+        store = self.open()
+        self.assertEqual(store.find_by_video_key('youtube:dQw4w9WgXcQ')['title'], 'Rick')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""后处理线程池中的合并/转换（使用 ffmpeg 替身）"""
+import os
+import sys
+import tempfile
+import unittest
+
+from ytdlpcore import DownloadEngine, DownloadJob
+
+# ffmpeg 替身：把各个输入文件的内容拼接后写入输出文件；输入文件名含 "broken" 时失败
+FAKE_FFMPEG = '''#!{python}
+import sys
+inputs = [sys.argv[i + 1] for i, arg in enumerate(sys.argv) if arg == '-i']
+if any('broken' in path for path in inputs):
+    print("Invalid data found when processing input")
+    sys.exit(1)
+with open(sys.argv[-1], 'w') as f:
+    f.write('+'.join(open(path).read() for path in inputs))
+'''
+
+
+@unittest.skipIf(os.name == 'nt', "the ffmpeg stand-in is a script with a shebang")
+class PostprocessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        ffmpeg = os.path.join(self.directory, 'ffmpeg')
+        with open(ffmpeg, 'w') as f:
+            f.write(FAKE_FFMPEG.format(python=sys.executable))
+        os.chmod(ffmpeg, 0o755)
+        self.engine = DownloadEngine('yt-dlp')
+        self.addCleanup(self.engine.cleanup)
+        self.engine.ffmpeg_path = lambda: ffmpeg
+
+    def stream(self, video_id, format_id, name):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(format_id)
+        return video_id, format_id, path
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name)) as f:
+            return f.read()
+
+    def postprocess(self, kind, streams):
+        job = DownloadJob('https://x.com/u/status/1', [], title='t')
+        job.postprocess, job.streams, job.returncode = kind, streams, 0
+        return self.engine.postprocess(job)
+
+    def test_merges_each_entry_separately(self):
+        job = self.postprocess('mp4', [
+            self.stream('1', '137', 'a.f137.mp4'), self.stream('1', '140', 'a.f140.m4a'),
+            self.stream('2', '136', 'b.f136.mp4'), self.stream('2', '139', 'b.f139.m4a'),
+        ])
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.filepath, os.path.join(self.directory, 'b.mp4'))
+        self.assertEqual((self.read('a.mp4'), self.read('b.mp4')), ('137+140', '136+139'))
+        self.assertEqual(sorted(os.listdir(self.directory)), ['a.mp4', 'b.mp4', 'ffmpeg'])
+
+    def test_single_stream_entry_is_renamed(self):
+        job = self.postprocess('mp4', [
+            self.stream('1', '137', 'a.f137.mp4'), self.stream('1', '140', 'a.f140.m4a'),
+            self.stream('2', '18', 'b.f18.mp4'),
+        ])
+        self.assertEqual(job.status, 'done')
+        self.assertEqual((self.read('a.mp4'), self.read('b.mp4')), ('137+140', '18'))
+
+    def test_converts_each_entry_to_mp3(self):
+        job = self.postprocess('mp3', [self.stream('1', '251', 'a.f251.webm'), self.stream('2', '251', 'b.f251.webm')])
+        self.assertEqual(job.status, 'done')
+        self.assertEqual((self.read('a.mp3'), self.read('b.mp3')), ('251', '251'))
+
+    def test_failed_merge_keeps_its_inputs(self):
+        job = self.postprocess('mp4', [
+            self.stream('1', '137', 'broken.f137.mp4'), self.stream('1', '140', 'broken.f140.m4a'),
+        ])
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, "Invalid data found when processing input")
+        self.assertEqual(sorted(os.listdir(self.directory)), ['broken.f137.mp4', 'broken.f140.m4a', 'ffmpeg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
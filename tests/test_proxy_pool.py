@@ -0,0 +1,192 @@
+"""代理池：选择、健康统计和故障切换（使用本机上的代理替身）"""
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from ytdlpcore import PROXY_POOL, DownloadEngine, DownloadJob, ProxyPool
+
+
+class _NoContentProxy(socketserver.StreamRequestHandler):
+    """代理替身：读完请求头后返回 204，相当于成功转发了健康检查请求"""
+
+    def handle(self):
+        while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+            pass
+        self.wfile.write(b'HTTP/1.1 204 No Content\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+
+
+def start_proxy(test):
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _NoContentProxy)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def dead_proxy():
+    """没有在监听的本机端口"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+# yt-dlp 替身：连不上 --proxy 时像 yt-dlp 一样报告代理错误，否则"下载"成功
+FAKE_YTDLP = '''#!{python}
+import socket, sys, urllib.parse
+args = sys.argv[1:]
+with open({calls!r}, 'a') as f:
+    f.write(' '.join(args) + '\\n')
+proxy = urllib.parse.urlsplit(args[args.index('--proxy') + 1])
+try:
+    socket.create_connection((proxy.hostname, proxy.port), timeout=5).close()
+except OSError:
+    print("ERROR: Unable to download webpage: ('Unable to connect to proxy', ConnectionRefusedError())", file=sys.stderr)
+    sys.exit(1)
+if '--flat-playlist' in args:
+    for n in range(3):
+        print('{{"id": "v%d", "url": "https://www.youtube.com/watch?v=v%d"}}' % (n, n))
+    sys.exit(0)
+index = args.index('--print-to-file')
+with open(args[index + 2], 'a') as f:
+    f.write('video.mp4\\n')
+'''
+
+
+class ProxyPoolChooseTest(unittest.TestCase):
+
+    def test_chooses_lowest_score(self):
+        pool = ProxyPool(['http://a:1', 'http://b:1'])
+        pool.report('http://a:1', True, latency=0.5)
+        pool.report('http://b:1', True, latency=0.1)
+        self.assertEqual(pool.choose('https://www.youtube.com/watch?v=x'), 'http://b:1')
+        self.assertEqual(pool.choose('https://www.youtube.com/watch?v=x', exclude=['http://b:1']), 'http://a:1')
+        self.assertIsNone(pool.choose('https://www.youtube.com/watch?v=x', exclude=['http://a:1', 'http://b:1']))
+
+    def test_unhealthy_after_consecutive_failures_and_recovers(self):
+        pool = ProxyPool(['http://a:1', 'http://b:1'])
+        pool.report('http://a:1', True, latency=0.01)
+        for _ in range(3):
+            pool.report('http://a:1', False, "Connection refused")
+        self.assertEqual(pool.choose('https://x.com/a/status/1'), 'http://b:1')
+        pool.report('http://a:1', True, latency=0.01)
+        self.assertTrue(dict((proxy, healthy) for proxy, _, _, healthy in pool.summary())['http://a:1'])
+
+    def test_direct_rule_falls_through_to_pool_when_excluded(self):
+        pool = ProxyPool(['http://a:1'], ProxyPool.parse_rules('bilibili.com=direct'))
+        url = 'https://www.bilibili.com/video/BV1xx411c7mD'
+        self.assertEqual(pool.choose(url), '')
+        self.assertEqual(pool.choose(url, exclude=['']), 'http://a:1')
+
+    def test_rule_proxy_down_falls_through_to_pool(self):
+        pool = ProxyPool(['http://a:1', 'http://b:1'], ProxyPool.parse_rules('youtube.com=http://a:1'))
+        pool.report('http://b:1', True, latency=1.0)
+        url = 'https://www.youtube.com/watch?v=x'
+        self.assertEqual(pool.choose(url), 'http://a:1')
+        for _ in range(3):
+            pool.report('http://a:1', False, "timed out")
+        self.assertEqual(pool.choose(url), 'http://b:1')
+
+    def test_prefer_while_healthy(self):
+        pool = ProxyPool(['http://a:1', 'http://b:1'])
+        pool.report('http://b:1', True, latency=0.01)
+        url = 'https://www.youtube.com/watch?v=x'
+        self.assertEqual(pool.choose(url, prefer='http://a:1'), 'http://a:1')
+        self.assertEqual(pool.choose(url, exclude=['http://a:1'], prefer='http://a:1'), 'http://b:1')
+        self.assertEqual(pool.choose(url, prefer='http://removed:1'), 'http://b:1')
+
+
+class ProxyPoolCheckTest(unittest.TestCase):
+
+    def test_check_against_local_proxies(self):
+        live, dead = start_proxy(self), dead_proxy()
+        pool = ProxyPool([dead, live], check_url='http://health.invalid/generate_204')
+        for _ in range(3):
+            pool.check_all()
+        summary = {proxy: (latency, healthy) for proxy, latency, _, healthy in pool.summary()}
+        self.assertTrue(summary[live][1])
+        self.assertIsNotNone(summary[live][0])
+        self.assertFalse(summary[dead][1])
+        self.assertEqual(pool.choose('https://www.youtube.com/watch?v=x'), live)
+
+
+@unittest.skipIf(os.name == 'nt', "the yt-dlp stand-in is a script with a shebang")
+class ProxyFailoverTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.calls = os.path.join(directory, 'calls.txt')
+        self.ytdlp = os.path.join(directory, 'yt-dlp')
+        with open(self.ytdlp, 'w') as f:
+            f.write(FAKE_YTDLP.format(python=sys.executable, calls=self.calls))
+        os.chmod(self.ytdlp, 0o755)
+
+    def commands(self):
+        with open(self.calls) as f:
+            return f.read().splitlines()
+
+    def test_fails_over_to_next_proxy_and_drops_probe_info_json(self):
+        live, dead = start_proxy(self), dead_proxy()
+        engine = DownloadEngine(self.ytdlp)
+        self.addCleanup(engine.cleanup)
+        engine.proxies = ProxyPool([dead, live])
+        engine.proxies.report(live, True, latency=0.5)
+        # 解析时用的是（之后坏掉的）dead，格式地址绑定了它的出口 IP
+        job = DownloadJob('https://www.youtube.com/watch?v=dQw4w9WgXcQ', ['--proxy', PROXY_POOL], title='t')
+        job.info_json = os.path.join(engine.workdir, 'probe.info.json')
+        with open(job.info_json, 'w') as f:
+            f.write('{}')
+        job.probed_at, job.probe_proxy = time.time(), dead
+
+        engine.run(job)
+
+        self.assertEqual(job.status, 'done')
+        first, second = self.commands()
+        self.assertIn('--load-info-json', first)
+        self.assertIn(dead, first)
+        self.assertNotIn('--load-info-json', second)
+        self.assertIn(live, second)
+        stats = engine.proxies.stats
+        self.assertEqual((stats[dead].failures, stats[live].successes), (1, 2))
+
+    def test_fails_when_every_proxy_is_down(self):
+        dead = dead_proxy()
+        engine = DownloadEngine(self.ytdlp)
+        self.addCleanup(engine.cleanup)
+        engine.proxies = ProxyPool([dead])
+        job = DownloadJob('https://www.youtube.com/watch?v=dQw4w9WgXcQ', ['--proxy', PROXY_POOL], title='t')
+
+        engine.run(job)
+
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(len(self.commands()), 1)
+
+    def test_playlist_listing_goes_through_the_pool(self):
+        live, dead = start_proxy(self), dead_proxy()
+        engine = DownloadEngine(self.ytdlp)
+        self.addCleanup(engine.cleanup)
+        engine.proxies = ProxyPool([live, dead])
+        engine.proxies.report(dead, True, latency=0.01)
+        url = 'https://www.youtube.com/playlist?list=PL1'
+
+        # 列出失败也计入代理的健康统计，连续失败后换用别的代理
+        for _ in range(3):
+            self.assertEqual(list(engine.iter_playlist(url, ['--proxy', PROXY_POOL])), [])
+        entries = list(engine.iter_playlist(url, ['--proxy', PROXY_POOL]))
+
+        self.assertEqual([entry['id'] for entry in entries], ['v0', 'v1', 'v2'])
+        commands = self.commands()
+        self.assertFalse(any(PROXY_POOL in command for command in commands))
+        self.assertTrue(all(dead in command for command in commands[:3]))
+        self.assertIn(live, commands[3])
+        stats = engine.proxies.stats
+        self.assertEqual((stats[dead].failures, stats[live].successes), (3, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
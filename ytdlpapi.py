@@ -0,0 +1,135 @@
+"""本地 JSON API（浏览器扩展、脚本推送链接），由 DownloadService.start_api() 按需导入"""
+import http.server
+import json
+import re
+import threading
+import urllib.parse
+
+from ytdlpcore import DownloadOptions
+
+
+class _ApiHandler(http.server.BaseHTTPRequestHandler):
+    """本地 JSON API
+
+    GET    /jobs        排队中、下载中和最近结束的任务及进度
+    GET    /jobs/<id>   一个任务
+    POST   /jobs        {"url": "...", 或 "urls": [...], "options": {"proxy", "cookies", "mp4", "mp3",
+                         "name", "tag", "fragments", "aria2c"}} 加入下载队列
+    DELETE /jobs/<id>   取消任务
+    """
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ytdlpgui'
+    disable_nagle_algorithm = True  # 响应头和正文分两次写出，不关闭 Nagle 时 keep-alive 连接每个请求要多等 40ms
+    OPTION_TYPES = {'proxy': str, 'cookies': bool, 'mp4': bool, 'mp3': bool, 'name': str, 'tag': str,
+                    'fragments': int, 'aria2c': bool}
+    MAX_BODY = 1024 * 1024
+
+    def log_message(self, format, *args):
+        pass  # 每秒可能有上百个请求，不写日志
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def check_request(self):
+        """只接受发往本机地址的请求（防止 DNS 重绑定），设置了 api_token 时检查令牌"""
+        host = (self.headers.get('Host') or '').rsplit(':', 1)[0].strip('[]').lower()
+        if host not in ('127.0.0.1', 'localhost', '::1'):
+            self.send_json(403, {'error': 'forbidden host'})
+            return False
+        token = self.server.token
+        if token and self.headers.get('X-Api-Token') != token:
+            self.send_json(401, {'error': 'invalid token'})
+            return False
+        return True
+
+    def job_id(self):
+        match = re.fullmatch(r'/jobs/(\d+)/?', urllib.parse.urlsplit(self.path).path)
+        return int(match.group(1)) if match else None
+
+    def do_GET(self):
+        if not self.check_request():
+            return
+        path = urllib.parse.urlsplit(self.path).path.rstrip('/')
+        downloads = self.server.service.downloads
+        if path == '/jobs':
+            self.send_json(200, {'jobs': [job.to_status() for job in downloads.snapshot()],
+                                 'active': downloads.active_count, 'pending': downloads.pending_count})
+            return
+        job = downloads.get(self.job_id()) if self.job_id() is not None else None
+        if job is None:
+            self.send_json(404, {'error': 'not found'})
+        else:
+            self.send_json(200, job.to_status())
+
+    def do_POST(self):
+        if not self.check_request():
+            return
+        if urllib.parse.urlsplit(self.path).path.rstrip('/') != '/jobs':
+            self.send_json(404, {'error': 'not found'})
+            return
+        # 要求 JSON 请求体：普通网页的跨站表单无法在没有 CORS 预检的情况下发送
+        if not (self.headers.get('Content-Type') or '').startswith('application/json'):
+            self.send_json(415, {'error': 'Content-Type must be application/json'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length < 0:
+                # rfile.read(-1) 会一直读到连接关闭
+                raise ValueError("invalid Content-Length")
+            if length > self.MAX_BODY:
+                raise ValueError("request body too large")
+            data = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(data, dict):
+                raise ValueError("request body must be a JSON object")
+            urls = data.get('urls') or [data.get('url') or '']
+            if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+                raise ValueError("'urls' must be a list of strings")
+            options = data.get('options') or {}
+            if not isinstance(options, dict):
+                raise ValueError("'options' must be an object")
+            for key, value in options.items():
+                expected = self.OPTION_TYPES.get(key)
+                if expected is None:
+                    raise ValueError(f"unknown option: {key}")
+                if value is not None and not isinstance(value, expected):
+                    raise ValueError(f"option {key} must be {expected.__name__}")
+            jobs, batches = self.server.service.enqueue(urls, DownloadOptions(**options))
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_json(202, {'jobs': [job.to_status() for job in jobs],
+                             'playlists': [{'id': batch.id, 'url': batch.source_url} for batch in batches]})
+
+    def do_DELETE(self):
+        if not self.check_request():
+            return
+        job_id = self.job_id()
+        job = self.server.service.downloads.cancel(job_id) if job_id is not None else None
+        if job is None:
+            self.send_json(404, {'error': 'not found or already finished'})
+        else:
+            self.send_json(202, job.to_status())
+
+
+class ApiServer(http.server.ThreadingHTTPServer):
+    """只监听 127.0.0.1 的本地 API，每个请求一个线程，不经过 Tk 主循环"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, service, port, token=None):
+        super().__init__(('127.0.0.1', port), _ApiHandler)
+        self.service = service
+        self.token = token
+        self.port = self.server_address[1]
+        threading.Thread(target=self.serve_forever, daemon=True, name='local-api').start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
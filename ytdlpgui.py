@@ -1,27 +1,119 @@
+import sys
+import time
+
+STARTUP_STARTED = time.perf_counter()  # --startup-profile 的计时起点
+
+if __name__ == '__main__' and '--headless' in sys.argv:
+    # 无界面模式：不导入 tkinter / ttkthemes，可以在没有显示器的服务器上运行
+    from ytdlpcore import main
+    sys.exit(main([arg for arg in sys.argv[1:] if arg != '--headless']))
+
 import tkinter as tk
-from tkinter import ttk, scrolledtext, filedialog, messagebox
+from tkinter import ttk, scrolledtext
 import subprocess
 import queue
 import os
-from ttkthemes import ThemedTk
-import ctypes
-import webbrowser
-import configparser
-import shutil
-import tempfile
-import json
-from datetime import datetime
+import threading
+import itertools
+import importlib.util
+# ttkthemes、webbrowser、tkinter 的对话框等只在用到时才导入，窗口能更早显示出来
+from ytdlpcore import (URL_PATTERN, DownloadJob, DownloadOptions, DownloadService, Settings, canonicalize_url,
+                       format_bytes, is_playlist_url, iter_batch_urls, normalize_url, read_lines, setup_file_log)
+
+# 下载队列中显示的任务状态
+JOB_STATUS_TEXT = {
+    'queued': '排队中',
+    'probing': '解析中',
+    'downloading': '下载中',
+    'merging': '合并中',
+    'done': '已完成',
+    'failed': '失败',
+    'skipped': '已跳过',
+    'cancelled': '已取消',
+}
+
+# 下载进度的刷新间隔（毫秒），多个任务的进度合并到每一帧中一次更新
+PROGRESS_INTERVAL = 250
+
+# 历史记录每次从数据库加载的条数
+HISTORY_PAGE_SIZE = 100
+
+# 剪贴板检查间隔（毫秒），内容保持不变超过 CLIPBOARD_DEBOUNCE 后才识别，
+# 避免复制过程中的中间内容或连续复制时每次都去解析
+CLIPBOARD_POLL_INTERVAL = 500
+CLIPBOARD_DEBOUNCE = 0.8
+
+# 日志区最多保留的行数，更早的日志只在 logs/ytdlpgui.log 中
+LOG_MAX_LINES = 2000
 
 # 设置DPI感知
-try:
-    ctypes.windll.shcore.SetProcessDpiAwareness(1)
-except:
-    pass
+if sys.platform == 'win32':
+    import ctypes
+    try:
+        ctypes.windll.shcore.SetProcessDpiAwareness(1)
+    except:
+        pass
+
+
+class StartupProfile:
+    """--startup-profile：在标准错误中打印启动各阶段的耗时"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.last = STARTUP_STARTED
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        print(f"[startup] {phase:<16} {(now - self.last) * 1000:7.1f} ms"
+              f"  (total {(now - STARTUP_STARTED) * 1000:7.1f} ms)", file=sys.stderr, flush=True)
+        self.last = now
+
+
+def create_root(theme='equilux'):
+    """创建主窗口并应用主题
+
+    ThemedTk 会导入 PIL 并加载 ttkthemes 的全部主题，这里只加载用到的这一个；
+    找不到主题文件时退回 ThemedTk。
+    """
+    root = tk.Tk()
+    spec = importlib.util.find_spec('ttkthemes')  # 只查找位置，不执行 ttkthemes/__init__.py
+    try:
+        directory = spec.submodule_search_locations[0]
+        root.tk.call('source', os.path.join(directory, 'png', theme, f'{theme}.tcl'))
+        root.tk.call('ttk::setTheme', theme)
+    except (AttributeError, TypeError, IndexError, tk.TclError):
+        root.destroy()
+        from ttkthemes import ThemedTk
+        root = ThemedTk(theme=theme)
+    return root
+
+
+def set_window_icon(root):
+    """设置窗口图标（标题栏和任务栏）"""
+    try:
+        # 使用 icon.png 设置图标
+        icon_image = tk.PhotoImage(file="icon.png")
+        root.iconphoto(True, icon_image)  # True 表示同时设置任务栏图标
+    except Exception as e:
+        # 如果加载失败，尝试使用 iconbitmap（适用于 .ico 文件）
+        try:
+            root.iconbitmap("icon.ico")
+        except:
+            pass
+
 
 class YtDlpGUI:
-    def __init__(self, master):
+    def __init__(self, master, profile=None):
         self.master = master
+        profile = profile or StartupProfile()
         master.title("yt-dlp GUI")
+
+        # 完整日志写入滚动日志文件，界面上只保留最近 LOG_MAX_LINES 行
+        self.file_log = setup_file_log(os.path.join('logs', 'ytdlpgui.log'))
+        # 日志和后台线程的事件都经过这个队列转回 Tk 主线程，所以要最先创建
+        self.queue = queue.Queue()
         
         # 设置主题
         self.style = ttk.Style()
@@ -62,20 +154,18 @@ class YtDlpGUI:
         # 创建顶部菜单栏
         self.create_menu_bar()
         
-        # 读取配置文件
-        self.config = configparser.ConfigParser()
-        try:
-            self.config.read('settings.ini')
-            self.download_path = self.config.get('Settings', 'download_path')
-            self.ytdlp_path = self.config.get('Settings', 'ytdlp_path')
-        except:
-            # 如果配置文件不存在或读取失败，使用默认值
-            self.download_path = os.path.join(os.path.expanduser("~"), "Downloads")
-            self.ytdlp_path = "yt-dlp"
-            if not os.path.exists(self.download_path):
-                self.download_path = os.getcwd()
-
+        # 读取配置文件，按配置组装下载引擎、队列、缓存、存档等（与无界面模式共用）
+        self.settings = Settings('settings.ini')
         self.last_downloaded_file = None
+        # 工作线程的事件通过 self.queue 转回 Tk 主线程
+        self.service = DownloadService(self.settings, log=self.log,
+                                       on_event=lambda event, job: self.queue.put((event, job)))
+        self.engine = self.service.engine
+        self.downloads = self.service.downloads
+        self.update_checker = self.service.update_checker
+        self.metadata_cache = self.service.metadata_cache
+        self.tags = self.service.tags
+        profile.mark('settings/engine')
 
         # URL输入区域
         self.url_label = ttk.Label(self.main_frame, text="URL:")
@@ -90,12 +180,16 @@ class YtDlpGUI:
         self.url_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, ipady=2)  # Use ipady to match other entries and fill X only
         # self.url_var.trace_add("write", self.on_url_change) # 移除自动去除参数功能
         self.url_entry.bind('<Return>', lambda e: self.start_download())  # Enter 键触发下载
+        self.url_entry.bind('<<Paste>>', self.on_url_paste)  # 粘贴多个链接时转为批量导入
         
         self.clean_button = ttk.Button(self.url_frame, text="remove Params", width=10, command=self.clean_url_params)
         self.clean_button.pack(side=tk.LEFT, padx=(4, 0))
 
         self.clear_button = ttk.Button(self.url_frame, text="Clear", width=5, command=self.clear_url)
         self.clear_button.pack(side=tk.LEFT, padx=(4, 0))
+
+        self.batch_button = ttk.Button(self.url_frame, text="批量导入", width=8, command=self.open_batch_dialog)
+        self.batch_button.pack(side=tk.LEFT, padx=(4, 0))
         
         self.url_frame.grid_columnconfigure(0, weight=1)
         
@@ -146,6 +240,15 @@ class YtDlpGUI:
         self.edit_cookie_button = ttk.Button(self.cookie_frame, text="编辑 Cookie", command=self.open_cookie_file)
         self.edit_cookie_button.pack(side=tk.LEFT, padx=8)
 
+        # 剪贴板监听：复制支持的视频链接后自动填入并在后台预先解析
+        self.clipboard_var = tk.BooleanVar(value=self.settings.clipboard_watch)
+        self.clipboard_checkbutton = ttk.Checkbutton(self.cookie_frame, text="监听剪贴板",
+                                                     variable=self.clipboard_var, command=self.toggle_clipboard_watch)
+        self.clipboard_checkbutton.pack(side=tk.LEFT, padx=8)
+        self._clipboard_seen = None  # 已经处理过（或开启监听时已有）的剪贴板内容
+        self._clipboard_pending = None  # 等待内容稳定的剪贴板内容和首次看到的时间
+        self._clipboard_timer = None
+
         # 格式选项区域
         self.format_frame = ttk.Frame(self.options_container)
         self.format_frame.pack(side=tk.TOP, anchor=tk.W, pady=2)
@@ -160,6 +263,18 @@ class YtDlpGUI:
                                              variable=self.mp3_var)
         self.mp3_checkbutton.pack(side=tk.LEFT, padx=8)
 
+        # 分片并发数和 aria2c：默认值来自 settings.ini，可以为每次下载单独调整
+        ttk.Label(self.format_frame, text="分片:").pack(side=tk.LEFT, padx=(16, 4))
+        self.fragments_var = tk.IntVar(value=self.settings.concurrent_fragments)
+        self.fragments_spinbox = ttk.Spinbox(self.format_frame, from_=1, to=32, width=3,
+                                             textvariable=self.fragments_var)
+        self.fragments_spinbox.pack(side=tk.LEFT)
+
+        self.aria2c_var = tk.BooleanVar(value=self.settings.external_downloader == 'aria2c')
+        self.aria2c_checkbutton = ttk.Checkbutton(self.format_frame, text="aria2c",
+                                                  variable=self.aria2c_var)
+        self.aria2c_checkbutton.pack(side=tk.LEFT, padx=8)
+
         # 下载按钮 - 移动到选项右侧，更加紧凑
         self.download_button = tk.Button(self.action_area, 
                                        text="Download（下载）", 
@@ -185,6 +300,63 @@ class YtDlpGUI:
         self.content_frame = ttk.Frame(self.main_frame)
         self.content_frame.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=12, pady=(0, 12))
         
+        # 下载队列区域 - 始终显示在历史记录/日志上方
+        self.jobs_frame = ttk.Frame(self.content_frame)
+        self.jobs_frame.pack(side=tk.TOP, fill=tk.X, padx=0, pady=(0, 8))
+
+        self.jobs_header = ttk.Frame(self.jobs_frame)
+        self.jobs_header.pack(fill=tk.X, padx=2, pady=2)
+
+        self.jobs_label = ttk.Label(self.jobs_header, text="下载队列:", font=('Segoe UI', 9, 'bold'))
+        self.jobs_label.pack(side=tk.LEFT, padx=5)
+
+        self.clear_jobs_button = tk.Button(self.jobs_header,
+                                           text="清除已完成",
+                                           command=self.clear_finished_jobs,
+                                           font=('Segoe UI', 8),
+                                           fg='#888888',
+                                           bg='#2b2b2b',
+                                           activebackground='#404040',
+                                           activeforeground='white',
+                                           relief=tk.FLAT,
+                                           padx=8)
+        self.clear_jobs_button.pack(side=tk.RIGHT, padx=5)
+
+        self.cancel_jobs_button = tk.Button(self.jobs_header,
+                                            text="取消所选",
+                                            command=self.cancel_selected_jobs,
+                                            font=('Segoe UI', 8),
+                                            fg='#888888',
+                                            bg='#2b2b2b',
+                                            activebackground='#404040',
+                                            activeforeground='white',
+                                            relief=tk.FLAT,
+                                            padx=8)
+        self.cancel_jobs_button.pack(side=tk.RIGHT, padx=5)
+
+        self.style.configure('Jobs.Treeview', background='#2b2b2b', fieldbackground='#2b2b2b',
+                             foreground='#cccccc', font=('Segoe UI', 9), borderwidth=0)
+        self.style.configure('Jobs.Treeview.Heading', background='#333333', foreground='#aaaaaa',
+                             font=('Segoe UI', 9))
+        self.style.map('Jobs.Treeview', background=[('selected', '#404040')])
+        self.jobs_tree = ttk.Treeview(self.jobs_frame, columns=('title', 'status', 'progress', 'speed', 'eta'),
+                                      show='headings', height=5, style='Jobs.Treeview')
+        self.jobs_tree.heading('title', text='视频', anchor=tk.W)
+        self.jobs_tree.heading('status', text='状态', anchor=tk.W)
+        self.jobs_tree.heading('progress', text='进度', anchor=tk.W)
+        self.jobs_tree.heading('speed', text='速度', anchor=tk.W)
+        self.jobs_tree.heading('eta', text='剩余', anchor=tk.W)
+        self.jobs_tree.column('title', width=300, anchor=tk.W)
+        self.jobs_tree.column('status', width=60, stretch=False, anchor=tk.W)
+        self.jobs_tree.column('progress', width=170, stretch=False, anchor=tk.W)
+        self.jobs_tree.column('speed', width=80, stretch=False, anchor=tk.W)
+        self.jobs_tree.column('eta', width=60, stretch=False, anchor=tk.W)
+        self.jobs_tree.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        jobs_scrollbar = ttk.Scrollbar(self.jobs_frame, orient=tk.VERTICAL, command=self.jobs_tree.yview)
+        jobs_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.jobs_tree.config(yscrollcommand=jobs_scrollbar.set)
+
         # 历史记录区域 - 整合边框和按钮
         self.history_frame = ttk.Frame(self.content_frame)
         self.history_frame.pack(fill=tk.BOTH, expand=True, padx=0, pady=0)
@@ -195,6 +367,13 @@ class YtDlpGUI:
         
         self.history_label = ttk.Label(self.history_inner_header, text="历史记录:", font=('Segoe UI', 9, 'bold'))
         self.history_label.pack(side=tk.LEFT, padx=5)
+
+        # 搜索框：输入时按标题、URL、日期实时过滤历史记录
+        ttk.Label(self.history_inner_header, text="搜索:", font=('Segoe UI', 9)).pack(side=tk.LEFT, padx=(12, 4))
+        self.history_search_var = tk.StringVar()
+        self.history_search_entry = ttk.Entry(self.history_inner_header, width=28, textvariable=self.history_search_var)
+        self.history_search_entry.pack(side=tk.LEFT)
+        self.history_search_var.trace_add("write", self.on_history_search)
         
         self.clear_history_button = tk.Button(self.history_inner_header, 
                                             text="清空记录", 
@@ -221,9 +400,10 @@ class YtDlpGUI:
         self.history_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.history_listbox.bind('<Double-Button-1>', self.on_history_select)
         
-        history_scrollbar = ttk.Scrollbar(self.history_frame, orient=tk.VERTICAL, command=self.history_listbox.yview)
-        history_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.history_listbox.config(yscrollcommand=history_scrollbar.set)
+        self.history_scrollbar = ttk.Scrollbar(self.history_frame, orient=tk.VERTICAL, command=self.history_listbox.yview)
+        self.history_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # 滚动到接近底部时再加载下一页
+        self.history_listbox.config(yscrollcommand=self.on_history_scroll)
         
         # 日志区域（默认隐藏）
         self.log_frame = ttk.Frame(self.content_frame)
@@ -233,13 +413,11 @@ class YtDlpGUI:
         self.log_text.pack(fill=tk.BOTH, expand=True)
         self.log_text.config(state=tk.DISABLED)
         
-        # 历史记录文件路径
-        self.history_file = 'download_history.json'
-        self.load_history()
-        
-        # 加载 Tags
-        self.tags_data = []
-        self.load_tags()
+        # 历史记录保存在 SQLite 中，窗口显示之后由 finish_startup() 打开
+        self.history = None
+        self.history_rows = []  # 已加载的记录，与列表框的行一一对应
+        self.history_exhausted = False  # 是否已经加载到最早的记录
+        self._history_page_pending = False
         
         # 默认显示历史记录，隐藏日志
         self.log_frame.pack_forget()
@@ -273,12 +451,50 @@ class YtDlpGUI:
         self.upgrade_button = ttk.Button(self.status_frame, text="升级 yt-dlp", command=self.upgrade_ytdlp, style='Status.TButton')
         self.upgrade_button.pack(side=tk.RIGHT, padx=2, pady=1)
 
+        # 所有下载中任务的总进度
+        self.total_progress = ttk.Progressbar(self.status_frame, orient=tk.HORIZONTAL, length=120,
+                                              mode='determinate', maximum=100)
+        self.total_progress.pack(side=tk.RIGHT, padx=6, pady=1)
+
+        # 全局限速和实际总速度
+        self.bandwidth_label = ttk.Label(self.status_frame, text="", style='Status.TLabel')
+        self.bandwidth_label.pack(side=tk.RIGHT, padx=6, pady=1)
+
+        # 因已在下载存档中而跳过的任务数
+        self.skipped_label = ttk.Label(self.status_frame, text="", style='Status.TLabel')
+        self.skipped_label.pack(side=tk.RIGHT, padx=6, pady=1)
+
         # 设置窗口最小尺寸
         master.update_idletasks()
         master.minsize(500, 400)
 
-        self.queue = queue.Queue()
         self.master.after(100, self.process_queue)
+        self.master.after(PROGRESS_INTERVAL, self.refresh_progress)
+
+    def finish_startup(self, profile=None):
+        """窗口显示之后再加载的部分：下载存档、元数据缓存、历史记录、Tag、未完成的任务、本地 API 等"""
+        profile = profile or StartupProfile()
+        # 恢复任务和批量导入要用到存档，先于它们读入
+        self.service.load_state()
+        profile.mark('archive/metadata cache')
+        self.load_history()
+        profile.mark('history')
+        self.load_tags()
+        profile.mark('tags')
+
+        # 恢复上次没有完成的下载任务
+        self.resume_jobs()
+        profile.mark('resume jobs')
+
+        # 本地 JSON API（浏览器扩展、脚本推送链接），在自己的线程中处理请求
+        self.service.start_api()
+        profile.mark('local api')
+
+        if self.clipboard_var.get():
+            self.toggle_clipboard_watch()
+
+        # 后台检查 yt-dlp 更新，不再在每次下载时使用 -U
+        threading.Thread(target=self.check_ytdlp_update, daemon=True).start()
 
     def create_menu_bar(self):
         """创建顶部菜单栏（使用 ttk 组件）"""
@@ -343,128 +559,143 @@ class YtDlpGUI:
 
     def clear_history(self):
         """清空所有历史记录"""
+        from tkinter import messagebox
         if messagebox.askyesno("确认", "确定要清空所有历史记录吗？"):
-            self.history_data = []
-            self.save_history()
+            self.history.clear()
             self.update_history_display()
             self.log("History cleared.")
 
+    @staticmethod
+    def open_url(url):
+        import webbrowser
+        webbrowser.open(url)
+
     def open_github_repo(self):
-        webbrowser.open("https://github.com/cornradio/ytdlpgui")
+        self.open_url("https://github.com/cornradio/ytdlpgui")
 
     def open_github_faq(self):
-        webbrowser.open("https://github.com/cornradio/ytdlpgui/blob/main/how-to-use-cookie.md")
+        self.open_url("https://github.com/cornradio/ytdlpgui/blob/main/how-to-use-cookie.md")
     def open_bilibili_video(self):
-        webbrowser.open("https://www.bilibili.com/video/BV1oJ7ezEEqK")
+        self.open_url("https://www.bilibili.com/video/BV1oJ7ezEEqK")
 
     def get_ytdlp(self):
-        webbrowser.open('https://github.com/yt-dlp/yt-dlp/wiki/Installation')
+        self.open_url('https://github.com/yt-dlp/yt-dlp/wiki/Installation')
     def get_ffmpeg(self):
-        webbrowser.open('https://github.com/ffbinaries/ffbinaries-prebuilt/releases')
+        self.open_url('https://github.com/ffbinaries/ffbinaries-prebuilt/releases')
 
     def load_history(self):
-        """加载历史记录"""
-        try:
-            if os.path.exists(self.history_file):
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    self.history_data = json.load(f)
-            else:
-                self.history_data = []
-            self.update_history_display()
-        except Exception as e:
-            self.log(f"Error loading history: {e}")
-            self.history_data = []
+        """打开历史记录数据库"""
+        self.history = self.service.open_history()
+        self.update_history_display()
 
-    def save_history(self):
-        """保存历史记录"""
+    def update_history_display(self):
+        """重新加载历史记录显示（只加载第一页，其余的在滚动时加载；有搜索词时显示搜索结果）"""
+        self.history_listbox.delete(0, tk.END)
+        self.history_rows = []
+        query = self.history_search_var.get().strip()
+        results = self.history.search(query) if query else None
+        if results is not None:
+            self.history_exhausted = True
+            self.history_rows = results
+            self.history_listbox.insert(tk.END, *[self.history_display_text(item) for item in results])
+            return
+        self.history_exhausted = False
+        self.load_history_page()
+
+    def on_history_search(self, *args):
+        """搜索词变化后稍等片刻再查询，连续输入时只查询最后一次"""
+        if hasattr(self, '_history_search_timer'):
+            self.master.after_cancel(self._history_search_timer)
+        self._history_search_timer = self.master.after(150, self.update_history_display)
+
+    def load_history_page(self):
+        """从数据库取下一页记录追加到列表末尾"""
+        self._history_page_pending = False
+        if self.history_exhausted:
+            return
+        before = self.history_rows[-1] if self.history_rows else None
+        rows = self.history.page(before=before, limit=HISTORY_PAGE_SIZE)
+        if len(rows) < HISTORY_PAGE_SIZE:
+            self.history_exhausted = True
+        self.history_rows.extend(rows)
+        self.history_listbox.insert(tk.END, *[self.history_display_text(item) for item in rows])
+
+    def on_history_scroll(self, first, last):
+        self.history_scrollbar.set(first, last)
+        if float(last) > 0.9 and not self.history_exhausted and not self._history_page_pending:
+            self._history_page_pending = True
+            self.master.after_idle(self.load_history_page)
+
+    def history_display_text(self, item):
+        title = item.get('title') or 'Unknown'
+        url = item.get('url', '')
+        # 截断过长的标题和URL
+        if len(title) > 40:
+            title = title[:37] + "..."
+        if len(url) > 40:
+            url = url[:37] + "..."
+        return f"{title} | {url}"
+
+    def add_to_history(self, url, title=None, video_key=None):
+        """添加历史记录（同一 URL 只保留一条，更新时间和标题）"""
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(self.history_data, f, ensure_ascii=False, indent=2)
+            item = self.history.upsert(url, title, video_key)
         except Exception as e:
             self.log(f"Error saving history: {e}")
+            return
+        self.show_history_item(item)
 
-    def update_history_display(self):
-        """更新历史记录显示"""
-        self.history_listbox.delete(0, tk.END)
-        # 按时间倒序显示，最新的在前面
-        for item in reversed(self.history_data[-50:]):  # 只显示最近50条
-            title = item.get('title', 'Unknown')
-            url = item.get('url', '')
-            # 截断过长的标题和URL
-            if len(title) > 40:
-                title = title[:37] + "..."
-            if len(url) > 40:
-                url = url[:37] + "..."
-            display_text = f"{title} | {url}"
-            self.history_listbox.insert(0, display_text)
-
-    def add_to_history(self, url, title=None):
-        """添加历史记录"""
-        # 检查是否已存在相同的URL
-        for item in self.history_data:
-            if item.get('url') == url:
-                # 更新现有记录的时间
-                item['timestamp'] = datetime.now().isoformat()
-                if title:
-                    item['title'] = title
-                self.save_history()
-                self.update_history_display()
-                return
-        
-        # 添加新记录
-        history_item = {
-            'url': url,
-            'title': title or 'Unknown',
-            'timestamp': datetime.now().isoformat()
-        }
-        self.history_data.append(history_item)
-        # 限制历史记录数量，最多保存1000条
-        if len(self.history_data) > 1000:
-            self.history_data = self.history_data[-1000:]
-        self.save_history()
-        self.update_history_display()
+    def show_history_item(self, item):
+        """新增或更新的历史记录显示到列表框最前面"""
+        if self.history_search_var.get().strip():
+            # 正在搜索时重新查询，新记录是否显示取决于搜索词
+            self.update_history_display()
+            return
+        # 只更新变化的行：旧位置上的记录移除，新记录放到最前面
+        for index, row in enumerate(self.history_rows):
+            if row['id'] == item['id']:
+                del self.history_rows[index]
+                self.history_listbox.delete(index)
+                break
+        self.history_rows.insert(0, item)
+        self.history_listbox.insert(0, self.history_display_text(item))
 
     def on_history_select(self, event):
         """双击历史记录项时填充URL"""
         selection = self.history_listbox.curselection()
-        if selection and self.history_data:
-            index = selection[0]
-            # 由于显示是倒序的，需要转换索引
-            # 只显示最近50条，所以需要计算实际索引
-            displayed_count = min(50, len(self.history_data))
-            actual_index = len(self.history_data) - 1 - index
-            if 0 <= actual_index < len(self.history_data):
-                url = self.history_data[actual_index].get('url', '')
-                self.url_entry.delete(0, tk.END)
-                self.url_entry.insert(0, url)
-                title = self.history_data[actual_index].get('title', 'Unknown')
-                self.log(f"Selected from history: {title}")
+        if selection and selection[0] < len(self.history_rows):
+            item = self.history_rows[selection[0]]
+            url = item.get('url', '')
+            self.url_entry.delete(0, tk.END)
+            self.url_entry.insert(0, url)
+            title = item.get('title') or 'Unknown'
+            self.log(f"Selected from history: {title}")
+            cached = self.metadata_cache.get(url)
+            if cached:
+                self.set_status(f"已从历史记录加载: {title}{self.format_metadata(cached)}")
+            else:
                 self.set_status(f"已从历史记录加载: {title}")
 
+    def format_metadata(self, entry):
+        """把缓存的时长和大小格式化为状态栏文字"""
+        parts = []
+        duration = entry.get('duration')
+        if duration:
+            minutes, seconds = divmod(int(duration), 60)
+            parts.append(f"时长 {minutes}:{seconds:02d}")
+        size = entry.get('filesize_approx')
+        if size:
+            parts.append(f"约 {size / 1024 / 1024:.1f} MB")
+        return f" ({', '.join(parts)})" if parts else ""
+
     def load_tags(self):
         """加载已保存的 tags"""
-        try:
-            if os.path.exists('tags_history.json'):
-                with open('tags_history.json', 'r', encoding='utf-8') as f:
-                    self.tags_data = json.load(f)
-            else:
-                self.tags_data = []
-            self.update_tag_combobox()
-        except Exception as e:
-            self.log(f"Error loading tags: {e}")
-            self.tags_data = []
-
-    def save_tags(self):
-        """保存 tags"""
-        try:
-            with open('tags_history.json', 'w', encoding='utf-8') as f:
-                json.dump(self.tags_data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            self.log(f"Error saving tags: {e}")
+        self.tags.load()
+        self.update_tag_combobox()
 
     def update_tag_combobox(self):
         """更新 tag 下拉菜单选项"""
-        values = list(self.tags_data)
+        values = list(self.tags.items)
         if values:
             values.append("--- 清除所有 Tag ---")
         self.tag_entry['values'] = values
@@ -473,9 +704,9 @@ class YtDlpGUI:
         """处理 tag 下拉菜单选择"""
         selected = self.tag_entry.get()
         if selected == "--- 清除所有 Tag ---":
+            from tkinter import messagebox
             if messagebox.askyesno("确认", "确定要清除所有已保存的 Tag 吗？"):
-                self.tags_data = []
-                self.save_tags()
+                self.tags.clear()
                 self.update_tag_combobox()
                 self.tag_entry.set("")
                 self.log("All tags cleared.")
@@ -494,24 +725,20 @@ class YtDlpGUI:
                 else:  # Linux
                     subprocess.run(['xdg-open', settings_path])
                 self.log(f"opened settings.ini: {settings_path}")
-                self.log(f"download_path: {self.download_path}")
-                self.log(f"ytdlp_path: {self.ytdlp_path}")
+                self.log(f"download_path: {self.settings.download_path}")
+                self.log(f"ytdlp_path: {self.settings.ytdlp_path}")
                 # 刷新配置文件
-                self.config.read('settings.ini')
-                self.download_path = self.config.get('Settings', 'download_path')
-                self.ytdlp_path = self.config.get('Settings', 'ytdlp_path')
+                self.settings.load()
+                self.service.apply_settings()
+                self.fragments_var.set(self.settings.concurrent_fragments)
+                self.aria2c_var.set(self.settings.external_downloader == 'aria2c')
             except Exception as e:
                 self.log(f"can't open settings.ini: {e}")
         else:
             self.log(f"settings.ini not found: {settings_path}")
             self.log(f"create settings.ini")
             USERNAME = os.getlogin()
-            self.config['Settings'] = {
-                'download_path': f'C:\\Users\\{USERNAME}\\Downloads',
-                'ytdlp_path': 'yt-dlp'
-            }
-            with open('settings.ini', 'w') as f:
-                self.config.write(f)
+            self.settings.write_defaults(f'C:\\Users\\{USERNAME}\\Downloads')
             self.open_settings()
 
     def toggle_proxy_entry(self):
@@ -523,7 +750,8 @@ class YtDlpGUI:
         if self.proxy_var.get():
             self.proxy_entry.config(state=tk.NORMAL)
             self.proxy_entry.delete(0, tk.END)  # Clear any previous content
-            self.proxy_entry.insert(0, "127.0.0.1:7890")  # Insert default proxy
+            # 配置了代理池时默认使用代理池
+            self.proxy_entry.insert(0, "pool" if self.engine.proxies else "127.0.0.1:7890")
         else:
             self.proxy_entry.delete(0, tk.END) # Clear content when disabling
             self.proxy_entry.config(state=tk.DISABLED)
@@ -556,41 +784,6 @@ class YtDlpGUI:
         except Exception as e:
             self.log(f"Error opening cookie.txt: {e}")
 
-    def get_video_title(self, url):
-        """获取视频标题"""
-        try:
-            # 构建获取信息的命令
-            info_command = [self.ytdlp_path, url, "--print", "%(title)s", "--no-download"]
-            
-            # 添加代理设置（如果启用）
-            if self.proxy_var.get():
-                proxy_address = self.proxy_entry.get()
-                if proxy_address:
-                    info_command.extend(["--proxy", proxy_address])
-            
-            # 添加cookie设置（如果启用）
-            if self.cookie_var.get():
-                cookie_path = os.path.abspath('cookie.txt')
-                if os.path.exists(cookie_path):
-                    try:
-                        temp_cookie_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False)
-                        temp_cookie_file.close()
-                        shutil.copy2(cookie_path, temp_cookie_file.name)
-                        info_command.extend(["--cookies", temp_cookie_file.name])
-                    except:
-                        pass
-            
-            result = subprocess.run(info_command, capture_output=True, text=True, timeout=15)
-            if result.returncode == 0:
-                title = result.stdout.strip()
-                return title if title else None
-        except subprocess.TimeoutExpired:
-            self.log("Timeout getting video title")
-        except Exception as e:
-            self.log(f"Could not get video title: {e}")
-            self.set_status(f"获取视频信息失败")
-        return None
-
     def start_download(self):
         url = self.url_entry.get()
         
@@ -598,162 +791,399 @@ class YtDlpGUI:
             self.log("Error: Please enter a URL.")
             return
 
-        # 获取视频标题并添加到历史记录
+        if is_playlist_url(url):
+            self.start_playlist(url)
+            return
+        # 同一视频的各种链接形式统一成规范链接，历史记录和下载存档按它去重
+        canonical = canonicalize_url(normalize_url(url))
+        if canonical:
+            url = canonical.url
+
+        download_args = self.build_download_args()
+        if download_args is None:
+            return
+        command, probe_args = download_args
+
+        # 视频信息在后台线程中获取，完成后通过 self.queue 回报 (on_job_probed)
+        job = DownloadJob(url, command, probe_args=probe_args)
+        # 手动下载单个视频（包括从历史记录重新下载、换成 MP3 再下载一次）不按下载存档跳过
+        job.ignore_archive = True
+        self.run_yt_dlp(job)
+
         self.log("Getting video information...")
         self.set_status("正在请求视频信息，请稍候...")
-        video_title = self.get_video_title(url)
-        if video_title:
-            self.add_to_history(url, video_title)
-            self.log(f"Video title: {video_title}")
-            self.set_status(f"解析成功: {video_title}", duration=5000)
+        self.download_button.config(state=tk.NORMAL)
+
+    def on_url_paste(self, event):
+        """粘贴的内容包含多个链接时打开批量导入窗口，而不是塞进单行输入框"""
+        try:
+            text = self.master.clipboard_get()
+        except tk.TclError:
+            return None
+        if len(list(itertools.islice(iter_batch_urls(text.splitlines()), 2))) < 2:
+            return None
+        self.open_batch_dialog(text)
+        return "break"
+
+    def read_clipboard(self):
+        try:
+            return self.master.clipboard_get()
+        except tk.TclError:
+            return None  # 剪贴板为空或不是文本
+
+    def toggle_clipboard_watch(self):
+        """开启时只处理之后复制的内容，已经在剪贴板里的不算"""
+        if self._clipboard_timer:
+            self.master.after_cancel(self._clipboard_timer)
+            self._clipboard_timer = None
+        if self.clipboard_var.get():
+            self._clipboard_seen = self.read_clipboard()
+            self._clipboard_pending = None
+            self._clipboard_timer = self.master.after(CLIPBOARD_POLL_INTERVAL, self.poll_clipboard)
+
+    def poll_clipboard(self):
+        text = self.read_clipboard()
+        now = time.monotonic()
+        if text is None or text == self._clipboard_seen:
+            self._clipboard_pending = None
+        elif self._clipboard_pending is None or self._clipboard_pending[0] != text:
+            self._clipboard_pending = (text, now)
+        elif now - self._clipboard_pending[1] >= CLIPBOARD_DEBOUNCE:
+            self._clipboard_seen = text
+            self._clipboard_pending = None
+            self.on_clipboard_url(text)
+        self._clipboard_timer = self.master.after(CLIPBOARD_POLL_INTERVAL, self.poll_clipboard)
+
+    def on_clipboard_url(self, text):
+        """剪贴板内容是单个支持的视频链接时填入输入框，并在后台预先解析"""
+        if not URL_PATTERN.fullmatch(text.strip()):
+            return  # 不是单独的一个链接（多个链接由粘贴时的批量导入处理）
+        url = normalize_url(text)
+        if is_playlist_url(url):
+            # 播放列表在开始下载时才展开，这里只填入
+            self.url_var.set(url)
+            self.set_status("已从剪贴板填入播放列表链接，按回车开始下载", duration=5000)
+            return
+        canonical = canonicalize_url(url)
+        if canonical is None:
+            return  # 不认识的网站，不自动处理
+        url = canonical.url
+        item = self.service.history.find_by_video_key(canonical.key) if self.service.history else None
+        if item:
+            self.set_status(f"剪贴板中的视频已经下载过: {item.get('title') or item['url']}", duration=5000)
+            return
+        if self.url_var.get() == url:
+            return
+        self.url_var.set(url)
+        try:
+            self.service.prewarm(url, self.download_options())
+        except ValueError:
+            # 代理、cookie 选项有误，按下载时再提示
+            self.set_status("已从剪贴板填入链接，按回车开始下载", duration=5000)
+            return
+        self.log(f"Prewarming video information from clipboard: {url}")
+        self.set_status("已从剪贴板填入链接，正在预先解析...", duration=10000)
+
+    def on_job_prewarmed(self, job):
+        """预先解析完成：输入框里还是这个链接时在状态栏提示（在 Tk 主线程中调用）"""
+        if self.url_var.get() != job.url:
+            return
+        if job.title:
+            self.set_status(f"已就绪: {job.title}{self.format_metadata(job.metadata or {})}，按回车开始下载",
+                            duration=10000)
         else:
-            # 即使获取标题失败，也记录URL
-            self.add_to_history(url, None)
-            self.set_status("无法解析视频标题，直接开始下载")
+            self.set_status("预先解析失败，按回车时将重新解析", duration=5000)
 
-        # 使用配置文件中的 ytdlp 路径
-        command = [self.ytdlp_path, url] # mac 需要加入两个单引号抱住url
-        
-        proxy_address = None
-        if self.proxy_var.get():
-            proxy_address = self.proxy_entry.get()
-            if not proxy_address: 
-                self.log("Error: 'Use Proxy' is checked, but the proxy address is empty. Please provide a proxy or uncheck the box.")
-                return
-            command.extend(["--proxy", proxy_address])
+    def open_batch_dialog(self, text=""):
+        """批量导入：粘贴多行链接，或从 .txt / .csv 文件导入"""
+        dialog = tk.Toplevel(self.master)
+        dialog.title("批量导入")
+        dialog.configure(bg='#464646')
+        dialog.transient(self.master)
 
-        # Cookie设置
-        if self.cookie_var.get():
-            cookie_path = os.path.abspath('cookie.txt')
-            if not os.path.exists(cookie_path):
-                self.log("Error: 'Use Cookie' is checked, but cookie.txt file not found. Please click '编辑 Cookie' to create and edit the file.")
-                return
-            # 检查文件是否为空
-            try:
-                with open(cookie_path, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    if not content or content.startswith('#') and len(content.split('\n')) <= 3:
-                        self.log("Warning: cookie.txt appears to be empty or only contains comments. Please add your cookies.")
-            except Exception as e:
-                self.log(f"Error reading cookie.txt: {e}")
-                return
-            
-            # 复制 cookie 文件到临时文件，避免 yt-dlp 修改原始文件
+        frame = ttk.Frame(dialog, padding="12")
+        frame.pack(fill=tk.BOTH, expand=True)
+        ttk.Label(frame, text="每行一个或多个链接（重复和跟踪参数会自动去除）:").pack(anchor=tk.W, pady=(0, 6))
+
+        text_box = scrolledtext.ScrolledText(frame, width=70, height=15, bg='#2b2b2b', fg='white',
+                                             insertbackground='white', font=('Consolas', 10))
+        text_box.pack(fill=tk.BOTH, expand=True)
+        text_box.insert('1.0', text)
+
+        buttons = ttk.Frame(frame)
+        buttons.pack(fill=tk.X, pady=(8, 0))
+
+        def import_file():
+            from tkinter import filedialog
+            path = filedialog.askopenfilename(parent=dialog, title="选择链接文件",
+                                              filetypes=[("Text / CSV", "*.txt *.csv"), ("All files", "*.*")])
+            if path:
+                dialog.destroy()
+                self.start_batch(read_lines(path), os.path.basename(path))
+
+        def import_text():
+            lines = text_box.get('1.0', tk.END).splitlines()
+            dialog.destroy()
+            self.start_batch(lines, "粘贴的链接")
+
+        ttk.Button(buttons, text="从文件导入...", command=import_file).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="取消", command=dialog.destroy).pack(side=tk.RIGHT)
+        ttk.Button(buttons, text="开始下载", command=import_text).pack(side=tk.RIGHT, padx=8)
+        text_box.focus_set()
+
+    def start_batch(self, lines, name):
+        """把文本行中的链接逐个加入下载队列（在后台线程中读取，不阻塞界面）
+
+        其中的播放列表/频道与单独输入时一样逐个展开（DownloadService.feed_lines）。
+        """
+        download_args = self.build_download_args(batch=True)
+        if download_args is None:
+            return
+        command, probe_args = download_args
+        batch = self.service.feed_lines(lines, command, probe_args, name)[0]
+        self.log(f"Batch import started: {name}")
+        self.set_status(f"批量导入中: {name}", duration=5000)
+        return batch
+
+    def start_playlist(self, url):
+        """展开播放列表/频道，逐个视频加入下载队列"""
+        download_args = self.build_download_args(batch=True)
+        if download_args is None:
+            return
+        command, probe_args = download_args
+        self.downloads.expand(url, lambda entry_url: DownloadJob(entry_url, command, probe_args=probe_args),
+                              probe_args=probe_args, known=self.service.in_history)
+        self.log(f"Expanding playlist: {url}")
+        self.set_status("正在展开播放列表，边列出边下载...", duration=5000)
+
+    def on_batch_state(self, batch):
+        """批量导入进度（在 Tk 主线程中调用）"""
+        if batch.error:
+            self.log(f"Batch import error ({batch.name}): {batch.error}")
+        if batch.done and batch.source_url:
+            # 播放列表本身也记入历史（与无界面模式共用 DownloadService.record_playlist）
             try:
-                temp_cookie_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False)
-                temp_cookie_file.close()
-                shutil.copy2(cookie_path, temp_cookie_file.name)
-                command.extend(["--cookies", temp_cookie_file.name])
-                self.log(f"Using cookies from: {cookie_path} (copied to temp file to prevent modification)")
+                item = self.service.record_playlist(batch)
             except Exception as e:
-                self.log(f"Error copying cookie file: {e}")
-                return
-
-        command.extend(["-U"])
-        
-        # Add format selection for MP4
-        if self.mp4_var.get():
-            command.extend(["-f", "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best"])
-            # 添加自动合并参数，确保视频和音频自动合并
-            command.extend(["--merge-output-format", "mp4"])
-        
-        # Add format selection for MP3
-        if self.mp3_var.get():
-            command.extend(["--extract-audio", "--audio-format", "mp3"])
-        
-        if self.rename_var.get():
-            base_name = self.rename_entry.get().strip()
-            tag_val = self.tag_entry.get().strip()
-            
-            if base_name or tag_val:
-                # 如果没有写文件名但写了tag，则使用视频原本标题作为文件名
-                if not base_name:
-                    new_name = f"%(title)s"
-                else:
-                    new_name = base_name
-                
-                if tag_val:
-                    new_name = f"{new_name}#{tag_val}"
-                    # 记录新 Tag
-                    if tag_val not in self.tags_data:
-                        self.tags_data.append(tag_val)
-                        self.save_tags()
-                        self.update_tag_combobox()
-                
-                # 确保文件名中不包含非法字符（简单处理）
-                for char in ['<', '>', ':', '"', '/', '\\', '|', '?', '*']:
-                    new_name = new_name.replace(char, '_')
-                command.extend(["-o", f"{new_name}.%(ext)s"])
+                self.log(f"Error saving history: {e}")
             else:
-                command.extend(["-o", "%(title)s-%(id)s.%(ext)s"])
+                self.show_history_item(item)
+                self.log(f"Playlist expanded: {item['title']}")
+            self.set_status(f"播放列表展开完成: 共加入 {batch.submitted} 个视频", duration=5000)
+        elif batch.done:
+            self.log(f"Batch import finished: {batch.name}, {batch.submitted} URLs queued")
+            self.set_status(f"批量导入完成: 共加入 {batch.submitted} 个链接", duration=5000)
         else:
-            command.extend(["-o", "%(title)s-%(id)s.%(ext)s"])
-        
-        # 使用配置文件中的下载路径
-        command.extend(["-P", self.download_path])
-        self.log(f"Files will be downloaded to: {self.download_path}")
+            self.set_status(f"批量导入中: 已加入 {batch.submitted} 个链接", duration=5000)
 
-        # 构建完整的命令字符串
-        cmd_str = " ".join(command)
-        self.log(f"Running: {cmd_str}")
+    def download_options(self, batch=False):
+        """界面上当前的下载选项"""
+        try:
+            fragments = self.fragments_var.get()
+        except tk.TclError:
+            fragments = None
+        renamed = self.rename_var.get()
+        return DownloadOptions(proxy=self.proxy_entry.get() if self.proxy_var.get() else None,
+                               cookies=self.cookie_var.get(), mp4=self.mp4_var.get(), mp3=self.mp3_var.get(),
+                               name=self.rename_entry.get() if renamed else '',
+                               tag=self.tag_entry.get() if renamed else '',
+                               fragments=fragments, aria2c=self.aria2c_var.get(), batch=batch)
 
-        # 在Windows下使用cmd.exe执行命令
-        if os.name == 'nt':
-            # 使用cmd /k 来保持窗口打开
-            full_cmd = f'cmd /k "{cmd_str}"'
-            subprocess.Popen(full_cmd, shell=True)
-        else:
-            # 在Linux/Mac下使用终端
-            if os.uname().sysname == 'Darwin':
-                subprocess.Popen(['osascript', '-e', f'tell app "Terminal" to do script "{cmd_str}"'])
-            else:
-                subprocess.Popen(['x-terminal-emulator', '-e', cmd_str])
+    def build_download_args(self, batch=False):
+        """根据界面选项生成 URL 之后的 yt-dlp 参数
 
-        self.set_status("下载任务已在独立窗口中启动", duration=5000)
-        self.download_button.config(state=tk.NORMAL)
+        返回 (下载参数, 解析参数)，选项有误时返回 None。batch 为 True 时同一组参数
+        会用于多个视频，自定义文件名后会加上视频 ID 以免互相覆盖。
+        """
+        try:
+            download_args = self.service.build_args(self.download_options(batch))
+        except ValueError as e:
+            self.log(f"Error: {e}")
+            return None
+        # 可能记录了新 Tag
+        self.update_tag_combobox()
+        return download_args
 
     def upgrade_ytdlp(self):
-        """升级 yt-dlp"""
-        cmd_str = "pipx upgrade yt-dlp"
-        self.log(f"Running: {cmd_str}")
-        
-        if os.name == 'nt':
-            # Windows
-            full_cmd = f'cmd /k "{cmd_str}"'
-            subprocess.Popen(full_cmd, shell=True)
+        """升级 yt-dlp：等正在进行的下载结束后在后台运行，期间新任务暂不开始"""
+        if self.downloads.active_count:
+            self.set_status("将在当前下载完成后升级 yt-dlp...", duration=5000)
         else:
-            # Linux/Mac fallback (though ytdlpgui.py is mainly for windows, keeping it safe)
-            if hasattr(os, 'uname') and os.uname().sysname == 'Darwin':
-                subprocess.Popen(['osascript', '-e', f'tell app "Terminal" to do script "{cmd_str}"'])
-            else:
-                subprocess.Popen(['x-terminal-emulator', '-e', cmd_str])
-        
-        self.set_status("正在独立窗口中升级 yt-dlp...", duration=5000)
+            self.set_status("正在升级 yt-dlp...", duration=5000)
+        self.upgrade_button.config(state=tk.DISABLED)
 
-    def run_yt_dlp(self, command):
-        # 这个方法不再需要，因为我们直接在CMD窗口中执行命令
-        pass
+        def upgrade():
+            succeeded = self.engine.upgrade()
+            self.queue.put(('ytdlp_upgraded', succeeded, self.update_checker.check(force=True)))
+        self.downloads.run_exclusive(upgrade)
+
+    def resume_jobs(self):
+        """从任务日志恢复上次未完成的任务，已有的 .part 文件由 yt-dlp 续传"""
+        try:
+            jobs = self.downloads.resume(self.settings.download_path)
+        except Exception as e:
+            self.log(f"Error resuming jobs: {e}")
+            return
+        if not jobs:
+            return
+        for job in jobs:
+            for path in job.partial_files:
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                self.log(f"[#{job.id}] Resuming partial file: {os.path.basename(path)} ({format_bytes(size)})")
+        self.log(f"Resumed {len(jobs)} unfinished jobs from last session")
+        self.set_status(f"已恢复上次未完成的 {len(jobs)} 个下载任务", duration=5000)
+
+    def check_ytdlp_update(self):
+        """在后台线程中检查 yt-dlp 新版本（使用缓存的结果时不访问网络）"""
+        self.queue.put(('update_checked', self.update_checker.check()))
+
+    def on_update_checked(self, result):
+        if not result or not result.get('update_available'):
+            return
+        self.log(f"yt-dlp update available: {result['current']} -> {result['latest']}")
+        if self.settings.auto_update_ytdlp:
+            self.upgrade_ytdlp()
+        else:
+            self.upgrade_button.config(text="升级 yt-dlp (有新版本)")
+            self.set_status(f"yt-dlp 有新版本 {result['latest']}，点击“升级 yt-dlp”更新", duration=8000)
+
+    def on_ytdlp_upgraded(self, succeeded, result):
+        self.upgrade_button.config(state=tk.NORMAL, text="升级 yt-dlp")
+        if succeeded:
+            version = (result or {}).get('current') or ''
+            self.set_status(f"yt-dlp 已升级 {version}", duration=5000)
+        else:
+            self.log("Error: yt-dlp upgrade failed, see log above.")
+            self.set_status("yt-dlp 升级失败", duration=5000)
+
+    def run_yt_dlp(self, job):
+        """把下载任务加入队列，状态变化通过 self.queue 回报"""
+        self.downloads.submit(job)
+
+    def on_job_probed(self, job):
+        """视频信息获取完成，记录历史（在 Tk 主线程中调用）"""
+        video_key = job.video_key
+        if job.title:
+            self.add_to_history(job.url, job.title, video_key)
+            self.log(f"[#{job.id}] Video title: {job.title}")
+            self.set_status(f"解析成功: {job.title}", duration=5000)
+        else:
+            # 即使获取标题失败，也记录URL
+            self.add_to_history(job.url, None, video_key)
+            self.set_status("无法解析视频标题，直接开始下载")
+
+    def job_row_values(self, job):
+        """下载队列中一行的内容：标题、状态、进度条、速度、剩余时间"""
+        progress = job.progress
+        percent = 100.0 if job.status == 'done' else job.percent
+        progress_text = speed_text = eta_text = ''
+        if percent is not None:
+            filled = int(percent / 10)
+            progress_text = f"{'█' * filled}{'░' * (10 - filled)} {percent:.0f}%"
+            if progress.get('fragment_count'):
+                progress_text += f" ({progress.get('fragment_index') or 0}/{progress['fragment_count']})"
+        if job.status == 'downloading':
+            if progress.get('speed'):
+                speed_text = f"{format_bytes(progress['speed'])}/s"
+            if progress.get('eta') is not None:
+                minutes, seconds = divmod(int(progress['eta']), 60)
+                eta_text = f"{minutes}:{seconds:02d}"
+        elif job.finished and job.elapsed is not None:
+            # 结束后速度一栏显示实测的平均速度
+            if job.throughput:
+                speed_text = f"平均 {format_bytes(job.throughput)}/s"
+            eta_text = f"{job.elapsed:.0f}s"
+        return (job.title or job.url, JOB_STATUS_TEXT.get(job.status, job.status),
+                progress_text, speed_text, eta_text)
+
+    def refresh_progress(self):
+        """按固定帧率刷新下载进度，只更新有变化的任务行"""
+        for job in self.downloads.take_progress():
+            iid = str(job.id)
+            if self.jobs_tree.exists(iid):
+                self.jobs_tree.item(iid, values=self.job_row_values(job))
+
+        downloaded = total = 0
+        for job in list(self.downloads.jobs.values()):
+            if job.status == 'downloading':
+                size = job.progress.get('total_bytes') or job.progress.get('total_bytes_estimate')
+                if size:
+                    total += size
+                    downloaded += job.progress.get('downloaded_bytes') or 0
+        self.total_progress['value'] = downloaded * 100.0 / total if total else 0
+
+        governor = self.engine.governor
+        if governor.enabled:
+            limit = governor.current_limit()
+            limit_text = f"限速 {format_bytes(limit)}/s" if limit else "不限速"
+            self.bandwidth_label.config(text=f"{limit_text} · {format_bytes(governor.measured_rate())}/s")
+        else:
+            self.bandwidth_label.config(text="")
+        self.master.after(PROGRESS_INTERVAL, self.refresh_progress)
+
+    def on_job_state(self, job):
+        """更新下载队列中的任务行（在 Tk 主线程中调用）"""
+        iid = str(job.id)
+        values = self.job_row_values(job)
+        if self.jobs_tree.exists(iid):
+            self.jobs_tree.item(iid, values=values)
+        else:
+            self.jobs_tree.insert('', tk.END, iid=iid, values=values)
+            self.jobs_tree.see(iid)
+
+    def cancel_selected_jobs(self):
+        """取消下载队列中选中的任务"""
+        for iid in self.jobs_tree.selection():
+            self.downloads.cancel(int(iid))
+
+    def clear_finished_jobs(self):
+        """从下载队列列表中移除已完成和失败的任务"""
+        active = {str(job_id) for job_id in list(self.downloads.jobs)}
+        for iid in self.jobs_tree.get_children():
+            if iid not in active:
+                self.jobs_tree.delete(iid)
+
+    def on_job_skipped(self, job):
+        """任务的视频已在下载存档中（在 Tk 主线程中调用）"""
+        self.skipped_label.config(text=f"已跳过 {self.downloads.skipped_count}")
+        self.set_status(f"已下载过，跳过: {job.title or job.url}", duration=3000)
+
+    def on_job_finished(self, job):
+        """下载任务结束（在 Tk 主线程中调用）"""
+        name = job.title or job.url
+        if job.succeeded:
+            if job.filepath:
+                self.last_downloaded_file = job.filepath
+                self.log(f"[#{job.id}] Saved to: {job.filepath}")
+            throughput = f", average {format_bytes(job.throughput)}/s" if job.throughput else ""
+            self.log(f"[#{job.id}] Finished in {job.elapsed:.1f}s{throughput}")
+            self.set_status(f"下载完成 ({job.elapsed:.1f} 秒): {name}", duration=5000)
+        elif job.cancelled:
+            self.set_status(f"已取消: {name}", duration=3000)
+        else:
+            self.log(f"[#{job.id}] Error: {job.error}")
+            self.set_status(f"下载失败: {name}", duration=5000)
 
     def enable_open_folder_button(self):
         # This method now primarily ensures the button is normal.
-        # If self.download_path is None, clicking it will log a message.
+        # If self.settings.download_path is None, clicking it will log a message.
         self.open_folder_button.config(state=tk.NORMAL)
 
     def open_download_folder(self):
-        if self.download_path and os.path.isdir(self.download_path): # Check if path exists and is a directory
+        if self.settings.download_path and os.path.isdir(self.settings.download_path): # Check if path exists and is a directory
             try:
                 if os.name == 'nt': 
-                    os.startfile(os.path.realpath(self.download_path))
+                    os.startfile(os.path.realpath(self.settings.download_path))
                 elif os.uname().sysname == 'Darwin': 
-                    subprocess.run(['open', self.download_path], check=True)
+                    subprocess.run(['open', self.settings.download_path], check=True)
                 else: 
-                    subprocess.run(['xdg-open', self.download_path], check=True)
+                    subprocess.run(['xdg-open', self.settings.download_path], check=True)
             except FileNotFoundError: # Should be caught by os.path.isdir, but as a fallback
-                 self.log(f"Error: Download folder not found at {self.download_path}")
+                 self.log(f"Error: Download folder not found at {self.settings.download_path}")
             except Exception as e:
-                self.log(f"Could not open folder: {e}. Please open manually: {self.download_path}")
-        elif self.download_path: # Path was set but is not a valid directory
-            self.log(f"Error: Download path '{self.download_path}' is not a valid directory or does not exist.")
+                self.log(f"Could not open folder: {e}. Please open manually: {self.settings.download_path}")
+        elif self.settings.download_path: # Path was set but is not a valid directory
+            self.log(f"Error: Download path '{self.settings.download_path}' is not a valid directory or does not exist.")
         else: # No download path has been set yet
             self.log("No download directory has been selected yet.")
 
@@ -778,6 +1208,7 @@ class YtDlpGUI:
         self.url_entry.delete(0, tk.END)
 
     def log(self, message):
+        self.file_log.info(message)
         self.queue.put(message)
 
     def set_status(self, message, duration=3000):
@@ -789,43 +1220,62 @@ class YtDlpGUI:
         self._status_timer = self.master.after(duration, lambda: self.status_var.set("准备就绪"))
 
     def clean_url_params(self):
-        """手动删除 URL 中的参数 (?)"""
+        """手动删除 URL 中的冗余参数：能识别的视频链接换成规范链接，其他链接去掉跟踪参数"""
         url = self.url_var.get().strip()
-        if '?' in url:
-            base_url = url.split('?')[0]
-            if base_url != url:
-                self.url_var.set(base_url)
-                self.set_status("已手动删除 URL 中的冗余参数 (?)")
-                self.log(f"Cleaned URL: {base_url}")
+        if not url:
+            return
+        canonical = canonicalize_url(normalize_url(url))
+        clean_url = canonical.url if canonical else normalize_url(url)
+        if clean_url != url:
+            self.url_var.set(clean_url)
+            self.set_status("已手动删除 URL 中的冗余参数 (?)")
+            self.log(f"Cleaned URL: {clean_url}")
 
     def process_queue(self):
+        # 一次取完队列，日志合并成一次插入，避免每行都操作一次 Tk 控件
+        lines = []
         try:
             while True:
                 message = self.queue.get_nowait()
-                self.log_text.config(state=tk.NORMAL)
-                self.log_text.insert(tk.END, message + "\n")
-                self.log_text.config(state=tk.DISABLED)
-                self.log_text.see(tk.END)
+                if isinstance(message, tuple):
+                    # 后台线程回报的事件：(事件名, 参数...)
+                    event, *args = message
+                    getattr(self, f"on_{event}")(*args)
+                else:
+                    lines.append(message)
                 self.queue.task_done()
         except queue.Empty:
             pass
+        if lines:
+            self.append_log(lines)
         self.master.after(100, self.process_queue)
 
+    def append_log(self, lines):
+        """把多行日志一次写入日志区，超过 LOG_MAX_LINES 时删除最早的行"""
+        lines = lines[-LOG_MAX_LINES:]
+        self.log_text.config(state=tk.NORMAL)
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        # 末尾总有一个空行，所以实际行数是 index - 1
+        excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+        if excess > 0:
+            self.log_text.delete('1.0', f'{excess + 1}.0')
+        self.log_text.config(state=tk.DISABLED)
+        self.log_text.see(tk.END)
+
 if __name__ == '__main__':
-    root = ThemedTk(theme="equilux")
+    profile = StartupProfile(enabled='--startup-profile' in sys.argv)
+    profile.mark('imports')
+    root = create_root()
     root.configure(bg='#2b2b2b')  # 设置窗口背景为深黑色，菜单栏也会是黑色
-    
-    # 设置窗口图标（标题栏和任务栏）
-    try:
-        # 使用 icon.png 设置图标
-        icon_image = tk.PhotoImage(file="icon.png")
-        root.iconphoto(True, icon_image)  # True 表示同时设置任务栏图标
-    except Exception as e:
-        # 如果加载失败，尝试使用 iconbitmap（适用于 .ico 文件）
-        try:
-            root.iconbitmap("icon.ico")
-        except:
-            pass
-        
-    gui = YtDlpGUI(root)
+    profile.mark('window/theme')
+
+    gui = YtDlpGUI(root, profile)
+    profile.mark('widgets')
+    # 先画出窗口，图标、历史记录等在第一帧之后再加载
+    root.update()
+    profile.mark('first frame')
+    set_window_icon(root)
+    profile.mark('icon')
+    gui.finish_startup(profile)
     root.mainloop()
+    gui.service.close()